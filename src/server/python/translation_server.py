@@ -1,26 +1,130 @@
 from fastapi import FastAPI, HTTPException
-from fastapi.responses import Response
-from pydantic import BaseModel
-from llama_cpp import Llama
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field
+from llama_cpp import Llama, LlamaGrammar, GGML_TYPE_Q8_0
+from llama_cpp.llama_speculative import LlamaPromptLookupDecoding
+import ctranslate2
+from transformers import AutoTokenizer
+import httpx
+import asyncio
+import json
 import logging
+import logging.handlers
+import queue
 import os
+import psutil
+import threading
 import time
-import re
-from huggingface_hub import hf_hub_download
+from collections import OrderedDict
+from typing import Literal, Optional
+from huggingface_hub import hf_hub_download, snapshot_download
 
 # Set up logging
-logging.basicConfig(level=logging.INFO)
+# Handlers only enqueue records; a listener thread does the stderr writes, so
+# logging never blocks the event loop on I/O
+log_queue = queue.SimpleQueue()
+logging.basicConfig(level=logging.INFO, handlers=[logging.handlers.QueueHandler(log_queue)])
+log_listener = logging.handlers.QueueListener(log_queue, logging.StreamHandler())
+log_listener.start()
 logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
 class TranslationRequest(BaseModel):
-    text: str
-    source_lang: str
-    target_lang: str
+    # Length limits are enforced by pydantic-core while parsing the body
+    text: str = Field(min_length=1, max_length=1000)
+    source_lang: str = Field(max_length=8)
+    target_lang: str = Field(max_length=8)
+    # Send the translation as server-sent events while it is being generated
+    stream: bool = False
+    # Override TRANSLATION_BACKEND for this request, e.g. "llama_cpp" for
+    # higher-quality phrasing; only backends listed in TRANSLATION_BACKENDS
+    # (loaded at startup) are accepted
+    backend: Optional[Literal["nllb", "llama_cpp"]] = None
 
-# Initialize Translation model
-try:
+# Optional out-of-process backend speaking the OpenAI chat completions API
+# (llama.cpp's `llama-server -cb` or vLLM). When set, the embedded model is not
+# loaded and requests are forwarded so the engine can batch them together.
+backend_url = os.getenv('TRANSLATION_BACKEND_URL')
+# vLLM rejects requests without the served model name; llama-server ignores it
+backend_model = os.getenv('TRANSLATION_BACKEND_MODEL')
+client = None
+model = None
+# Held by the worker thread for the whole generation, so a streaming request
+# whose client disconnects cannot release the shared Llama context early
+model_lock = threading.Lock()
+
+# Constrain the embedded model to a single <TL>...</TL> block so it cannot
+# spend tokens on preambles like "Here is the translation"
+tl_grammar = LlamaGrammar.from_string('root ::= "<TL>" [^<]+ "</TL>"', verbose=False)
+
+# Every stop string is matched against the decoded tail after each token.
+# Unconstrained backends need the full list to cut off preambles and notes;
+# with the grammar those cannot occur, so only parenthesized notes remain.
+STOP_SEQUENCES = ["</s>", "[/INST]", "Note:", "(", "Translation:", "User:", "Input:", "Here", "This", "</instructions>", "</input>", "</TL>"]
+GRAMMAR_STOP_SEQUENCES = ["("]
+
+# Generation settings are the same for every request, so build them once.
+# Greedy decoding for every input: translation wants the most likely output,
+# and the argmax skips the top-k/top-p/softmax sampling stack.
+GENERATION_PARAMS = {
+    "max_tokens": 1024,
+    "temperature": 0.0,  # top_p/top_k are meaningless under greedy decoding
+    "repeat_penalty": 1.3
+}
+
+# Remote request body minus the messages; llama-server reads `repeat_penalty`,
+# vLLM reads `repetition_penalty`
+BACKEND_PARAMS = {
+    "stop": STOP_SEQUENCES,
+    "repetition_penalty": GENERATION_PARAMS["repeat_penalty"],
+    **GENERATION_PARAMS
+}
+if backend_model:
+    BACKEND_PARAMS["model"] = backend_model
+
+# Model family serving /translate: "nllb" (NLLB-200 seq2seq model through
+# CTranslate2, ~1GB of VRAM) or "llama_cpp" (chat LLM, embedded or remote).
+# NLLB is the default: decode is bound by weight reads, and it reads a small
+# fraction of Mixtral's active weights per token. Pointing
+# TRANSLATION_BACKEND_URL at a server implies the LLM.
+translation_backend = os.getenv('TRANSLATION_BACKEND', 'llama_cpp' if backend_url else 'nllb')
+# Every backend requests may select, all loaded at startup; the default
+# backend is always included
+translation_backends = [translation_backend] + [
+    name.strip()
+    for name in os.getenv('TRANSLATION_BACKENDS', '').split(',')
+    if name.strip() and name.strip() != translation_backend
+]
+translator = None
+tokenizer = None
+loaded_backends = set()
+
+# Concurrent NLLB requests are coalesced into a single translate_batch call:
+# the worker waits a few ms after the first request for others to arrive
+NLLB_BATCH_WINDOW = 0.01
+NLLB_MAX_BATCH_SIZE = 16
+nllb_queue = asyncio.Queue()
+nllb_worker = None
+
+# NLLB-200 (FLORES) codes for the languages offered by the client
+flores_codes = {
+    'en': 'eng_Latn',
+    'es': 'spa_Latn',
+    'fr': 'fra_Latn',
+    'de': 'deu_Latn',
+    'it': 'ita_Latn',
+    'pt': 'por_Latn',
+    'nl': 'nld_Latn',
+    'pl': 'pol_Latn',
+    'ru': 'rus_Cyrl',
+    'zh': 'zho_Hans',
+    'ja': 'jpn_Jpan',
+    'ko': 'kor_Hang'
+}
+
+def initialize_model():
+    global model
     start_time = time.time()
     
     model_id = "mradermacher/Mixtral-8x7B-Instruct-v0.1-GGUF"
@@ -36,18 +140,44 @@ try:
     logger.info(f"Loading model from: {model_path}")
     model_load_start = time.time()
 
+    # Speculative decoding: draft tokens are proposed from n-grams already in
+    # the prompt (names, numbers, copied phrases) and verified in one forward
+    # pass. A separate draft model would need Mixtral's tokenizer, so use the
+    # prompt-lookup drafter. Opt-in (e.g. TRANSLATION_DRAFT_TOKENS=10): the
+    # output is in another language, so few prompt n-grams match, and each
+    # verified position routes to more of the MoE experts.
+    draft_tokens = int(os.getenv('TRANSLATION_DRAFT_TOKENS', '0'))
+    draft_model = LlamaPromptLookupDecoding(num_pred_tokens=draft_tokens) if draft_tokens > 0 else None
+
+    # One thread per physical core: SMT siblings share the vector units, so
+    # oversubscribing them only adds contention during sampling. Capped at the
+    # CPUs this process may run on (cgroup/taskset).
+    n_threads = int(os.getenv('TRANSLATION_THREADS', '0'))
+    if n_threads <= 0:
+        n_threads = min(
+            psutil.cpu_count(logical=False) or os.cpu_count(),
+            len(os.sched_getaffinity(0))
+        )
+    logger.info(f"Using {n_threads} CPU threads")
+
     # Initialize with GPU acceleration and memory efficient settings
     model = Llama(
         model_path=model_path,
         n_ctx=2048,          # Context window
-        n_batch=512,         # Batch size for prompt processing
+        n_batch=2048,        # Logical batch size for prompt processing
+        n_ubatch=512,        # Physical batch size per GPU forward pass
         n_gpu_layers=-1,     # Offload all to GPU
-        n_threads=8,         # CPU threads for processing
+        offload_kqv=True,    # Keep the KV cache in VRAM
+        flash_attn=True,     # Fused attention kernel, less memory traffic per token
+        type_k=GGML_TYPE_Q8_0,  # 8-bit KV cache halves the K/V bytes read per
+        type_v=GGML_TYPE_Q8_0,  # decoded token (quantized V needs flash_attn)
+        n_threads=n_threads,        # CPU threads for generation
+        n_threads_batch=n_threads,  # CPU threads for prompt processing
         main_gpu=0,         # Main GPU device to use
         tensor_split=None,   # Auto split tensors across GPUs if multiple available
-        seed=42,            # For reproducibility
-        use_mlock=False,    # Don't lock memory
+        use_mlock=True,     # Keep weights resident so pages are never evicted
         chat_format="mistral-instruct",
+        draft_model=draft_model,
         use_mmap=True       # Use memory mapping for efficient loading
     )
     
@@ -58,28 +188,26 @@ try:
     warmup_start = time.time()
     logger.info("Warming up model...")
     warmup_text = "This is a test sentence to warm up the model."
-    for length in [32, 64, 128]:
-        gen_start = time.time()
-        # Use chat completion API consistently
-        _ = model.create_chat_completion(
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a translator. Translate text to English. Provide only the translation, no explanations."
-                },
-                {
-                    "role": "user",
-                    "content": warmup_text
-                }
-            ],
-            max_tokens=length,
-            temperature=0.3,
-            top_p=0.95,
-            stop=["</s>"]
-        )
-        gen_time = time.time() - gen_start
-        tokens_per_sec = length / gen_time
-        logger.info(f"Warmup generation speed for {length} tokens: {tokens_per_sec:.1f} tokens/sec")
+    # A single 128-token run covers the shorter lengths as it generates past them
+    warmup_response = model.create_chat_completion(
+        messages=[
+            {
+                "role": "system",
+                "content": "You are a translator. Translate text to English. Provide only the translation, no explanations."
+            },
+            {
+                "role": "user",
+                "content": warmup_text
+            }
+        ],
+        max_tokens=128,
+        temperature=0.3,
+        top_p=0.95,
+        stop=["</s>"]
+    )
+    warmup_tokens = warmup_response["usage"]["completion_tokens"]
+    tokens_per_sec = warmup_tokens / (time.time() - warmup_start)
+    logger.info(f"Warmup generation speed for {warmup_tokens} tokens: {tokens_per_sec:.1f} tokens/sec")
             
     warmup_time = time.time() - warmup_start
     logger.info(f"Model warmup completed in {warmup_time:.2f} seconds")
@@ -90,69 +218,102 @@ try:
     logger.info(f"- Model loading: {model_load_time:.2f}s")
     logger.info(f"- Model warmup: {warmup_time:.2f}s")
     
-except Exception as e:
-    logger.error(f"Error initializing Translation model: {e}")
-    raise e
 
-def get_language_name(lang_code):
-    lang_map = {
-        'en': 'English',
-        'es': 'Spanish',
-        'fr': 'French',
-        'de': 'German',
-        'it': 'Italian',
-        'pt': 'Portuguese',
-        'nl': 'Dutch',
-        'pl': 'Polish',
-        'ru': 'Russian',
-        'zh': 'Chinese',
-        'ja': 'Japanese',
-        'ko': 'Korean'
-    }
-    return lang_map.get(lang_code, 'English')
+def initialize_nllb():
+    global translator, tokenizer
+    start_time = time.time()
 
-@app.post("/translate")
-async def translate(request: TranslationRequest):
-    try:
-        if not request.text.strip():
-            raise HTTPException(
-                status_code=400,
-                detail="Empty text provided for translation"
-            )
-            
-        if len(request.text) > 1000:
-            raise HTTPException(
-                status_code=400, 
-                detail="Text exceeds maximum length of 1000 characters"
+    model_id = "JustFrederik/nllb-200-distilled-600M-ct2-int8"
+    logger.info(f"Downloading model: {model_id}")
+    model_path = snapshot_download(
+        repo_id=model_id,
+        token=os.getenv('HUGGING_FACE_HUB_TOKEN')
+    )
+
+    # int8 weights with native int8 GEMMs; fp16 activations on GPU
+    device = "cuda" if ctranslate2.get_cuda_device_count() > 0 else "cpu"
+    compute_type = "int8_float16" if device == "cuda" else "int8"
+    logger.info(f"Using device: {device} ({compute_type})")
+
+    translator = ctranslate2.Translator(
+        model_path,
+        device=device,
+        compute_type=compute_type
+    )
+    tokenizer = AutoTokenizer.from_pretrained("facebook/nllb-200-distilled-600M")
+
+    init_time = time.time() - start_time
+    logger.info(f"NLLB model initialized in {init_time:.2f} seconds")
+
+async def load_backend(name):
+    global client, nllb_worker
+    if name == 'nllb':
+        await asyncio.to_thread(initialize_nllb)
+        nllb_worker = asyncio.create_task(nllb_batch_worker())
+    elif name == 'llama_cpp':
+        if backend_url:
+            logger.info(f"Using remote translation backend: {backend_url}")
+            client = httpx.AsyncClient(
+                base_url=backend_url,
+                timeout=httpx.Timeout(120.0, connect=5.0),
+                limits=httpx.Limits(max_connections=64, max_keepalive_connections=32)
             )
-            
-        request_start = time.time()
-        
-        # Prepare prompt
-        source_lang_name = get_language_name(request.source_lang)
-        target_lang_name = get_language_name(request.target_lang)
-        
-        # Generation
-        generate_start = time.time()
-        
-        # Adjust parameters based on input length
-        input_length = len(request.text.strip())
-        if input_length < 5:  # For very short inputs like "Ah", "Hi", etc.
-            temperature = 0.1
-            top_p = 0.1
-            top_k = 1
-        else:  # For normal inputs, keep existing creative parameters
-            temperature = 0.6
-            top_p = 0.95
-            top_k = 40
-        
-        # Use chat completion API with XML-formatted prompt
-        response = model.create_chat_completion(
-            messages=[
-                {
-                    "role": "user",
-                    "content": f"""<instructions>
-You are an expert translator from {source_lang_name} to {target_lang_name}, with deep understanding of idioms and natural expressions in both languages.
+        else:
+            await asyncio.to_thread(initialize_model)
+    else:
+        raise ValueError(f"Unknown translation backend: {name}")
+    loaded_backends.add(name)
+
+# Initialize Translation model at server startup rather than at import time,
+# so importing the module (e.g. by uvicorn worker processes) stays cheap
+@app.on_event("startup")
+async def load_translation_backend():
+    try:
+        for name in translation_backends:
+            await load_backend(name)
+
+    except Exception as e:
+        logger.error(f"Error initializing Translation model: {e}")
+        raise e
+
+@app.on_event("shutdown")
+async def close_translation_backend():
+    if nllb_worker is not None:
+        nllb_worker.cancel()
+    if client is not None:
+        await client.aclose()
+    log_listener.stop()
+
+# LRU cache of finished translations keyed by (text, source_lang, target_lang, backend)
+TRANSLATION_CACHE_SIZE = 10000
+translation_cache = OrderedDict()
+
+language_names = {
+    'en': 'English',
+    'es': 'Spanish',
+    'fr': 'French',
+    'de': 'German',
+    'it': 'Italian',
+    'pt': 'Portuguese',
+    'nl': 'Dutch',
+    'pl': 'Polish',
+    'ru': 'Russian',
+    'zh': 'Chinese',
+    'ja': 'Japanese',
+    'ko': 'Korean'
+}
+
+def get_language_name(lang_code):
+    return language_names.get(lang_code, 'English')
+
+def build_instructions(source_lang, target_lang):
+    source_lang_name = get_language_name(source_lang)
+    target_lang_name = get_language_name(target_lang)
+
+    # The language pair goes last so every request shares the same prompt
+    # prefix, letting the KV/prefix cache reuse it across language pairs
+    return f"""<instructions>
+You are an expert translator, with deep understanding of idioms and natural expressions in both languages.
 
 The input tag will be read and translated to the target language.
 Output ONLY the translated text in the format below with NO additional content.
@@ -178,40 +339,295 @@ Rules for translation:
 Examples of natural translations:
 - "having a great time" → "divertirsi molto" (not "avere un grande tempo")
 - "looking forward to" → "non vedo l'ora di" (not "guardando avanti a")
+
+Translate from {source_lang_name} to {target_lang_name}.
 </instructions>
-<input>
-{request.text}
+"""
+
+# Instructions for every pair the client offers, built once at import so the
+# request path is a single dict lookup
+instructions_by_pair = {
+    (source_lang, target_lang): build_instructions(source_lang, target_lang)
+    for source_lang in language_names
+    for target_lang in language_names
+}
+
+async def nllb_batch_worker():
+    while True:
+        batch = [await nllb_queue.get()]
+        await asyncio.sleep(NLLB_BATCH_WINDOW)
+        while len(batch) < NLLB_MAX_BATCH_SIZE and not nllb_queue.empty():
+            batch.append(nllb_queue.get_nowait())
+
+        try:
+            # CTranslate2 releases the GIL, so decode in a worker thread
+            results = await asyncio.to_thread(
+                translator.translate_batch,
+                [source for source, _, _ in batch],
+                target_prefix=[target_prefix for _, target_prefix, _ in batch],
+                beam_size=1,
+                max_decoding_length=512
+            )
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            continue
+
+        for (_, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result.hypotheses[0])
+
+async def translate_nllb(text, source_lang, target_lang):
+    # Build `<src_lang> tokens </s>` directly: setting tokenizer.src_lang would
+    # mutate shared state between concurrent requests, and encoding to ids only
+    # to convert them back to tokens is wasted work
+    source = [flores_codes.get(source_lang, 'eng_Latn'), *tokenizer.tokenize(text), tokenizer.eos_token]
+    target_prefix = [flores_codes.get(target_lang, 'eng_Latn')]
+
+    future = asyncio.get_running_loop().create_future()
+    await nllb_queue.put((source, target_prefix, future))
+    hypothesis = await future
+
+    # Drop the forced target language token
+    target = hypothesis[1:]
+    return tokenizer.decode(tokenizer.convert_tokens_to_ids(target), skip_special_tokens=True)
+
+def build_chat_messages(text, source_lang, target_lang):
+    # Use chat completion API with XML-formatted prompt
+    instructions = instructions_by_pair.get((source_lang, target_lang))
+    if instructions is None:
+        instructions = build_instructions(source_lang, target_lang)
+    messages = [
+        {
+            "role": "user",
+            "content": f"""{instructions}<input>
+{text}
 </input>"""
-                }
-            ],
-            max_tokens=1024,
-            temperature=temperature,
-            top_p=top_p,
-            top_k=top_k,
-            repeat_penalty=1.3,
-            stop=["</s>", "[/INST]", "Note:", "(", "Translation:", "User:", "Input:", "Here", "This", "</instructions>", "</input>", "</TL>"]
+        }
+    ]
+    return messages
+
+async def translate_llm(text, source_lang, target_lang):
+    messages = build_chat_messages(text, source_lang, target_lang)
+
+    if client is not None:
+        backend_response = await client.post(
+            "/v1/chat/completions",
+            json={"messages": messages, **BACKEND_PARAMS}
         )
-        generate_time = time.time() - generate_start
+        backend_response.raise_for_status()
+        response = backend_response.json()
+    else:
+        # Generate in a worker thread so the event loop keeps serving requests;
+        # the lock keeps calls on the shared Llama context sequential
+        def generate():
+            with model_lock:
+                return model.create_chat_completion(
+                    messages=messages,
+                    grammar=tl_grammar,
+                    stop=GRAMMAR_STOP_SEQUENCES,
+                    **GENERATION_PARAMS
+                )
+        response = await asyncio.to_thread(generate)
+
+    # Extract translation from response, removing TL tags
+    translation = (
+        response["choices"][0]["message"]["content"]
+        .strip()
+        .removeprefix("<TL>")
+        .removesuffix("</TL>")
+        .strip(' \t\r\n"\'')
+    )
+
+    return translation
+
+async def stream_llm(text, source_lang, target_lang):
+    # Yields raw content deltas as the backend decodes them
+    messages = build_chat_messages(text, source_lang, target_lang)
+
+    if client is not None:
+        async with client.stream(
+            "POST",
+            "/v1/chat/completions",
+            json={"messages": messages, **BACKEND_PARAMS, "stream": True}
+        ) as backend_response:
+            backend_response.raise_for_status()
+            async for line in backend_response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                data = line[len("data: "):]
+                if data == "[DONE]":
+                    break
+                delta = json.loads(data)["choices"][0]["delta"].get("content")
+                if delta:
+                    yield delta
+        return
+
+    # llama.cpp yields chunks from a blocking iterator: drain it in a worker
+    # thread and hand the deltas back to the event loop through a queue
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    cancelled = threading.Event()
+
+    def produce():
+        try:
+            with model_lock:
+                for chunk in model.create_chat_completion(
+                    messages=messages,
+                    grammar=tl_grammar,
+                    stop=GRAMMAR_STOP_SEQUENCES,
+                    stream=True,
+                    **GENERATION_PARAMS
+                ):
+                    if cancelled.is_set():
+                        break
+                    delta = chunk["choices"][0]["delta"].get("content")
+                    if delta:
+                        loop.call_soon_threadsafe(queue.put_nowait, delta)
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, None)
+
+    producer = asyncio.ensure_future(asyncio.to_thread(produce))
+    try:
+        while (delta := await queue.get()) is not None:
+            yield delta
+        await producer
+    finally:
+        # Client went away: stop decoding at the next token
+        cancelled.set()
+
+def clean_partial_translation(raw):
+    # Same cleanup as translate_llm, but holds back anything that may still
+    # turn into tags or trailing quotes/whitespace once more tokens arrive
+    text = raw.lstrip()
+    if "<TL>".startswith(text):
+        return ""
+    text = text.removeprefix("<TL>").lstrip(' \t\r\n"\'')
+    for size in range(len("</TL>"), 0, -1):
+        if text.endswith("</TL>"[:size]):
+            text = text[:-size]
+            break
+    return text.rstrip(' \t\r\n"\'')
+
+def sse_event(payload):
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+async def stream_translation(request, backend, cache_key):
+    request_start = time.time()
+    first_token_time = None
+    try:
+        if backend == 'nllb':
+            # NLLB decodes the whole sentence in one batch call
+            translation = await translate_nllb(request.text, request.source_lang, request.target_lang)
+            yield sse_event({"text": translation})
+        else:
+            raw = ""
+            sent = 0
+            async for delta in stream_llm(request.text, request.source_lang, request.target_lang):
+                if first_token_time is None:
+                    first_token_time = time.time() - request_start
+                raw += delta
+                visible = clean_partial_translation(raw)
+                if len(visible) > sent:
+                    yield sse_event({"text": visible[sent:]})
+                    sent = len(visible)
+            translation = (
+                raw.strip()
+                .removeprefix("<TL>")
+                .removesuffix("</TL>")
+                .strip(' \t\r\n"\'')
+            )
+            if len(translation) > sent:
+                yield sse_event({"text": translation[sent:]})
+    except Exception as e:
+        logger.error(f"Error in streaming translation: {str(e)}", exc_info=True)
+        yield sse_event({"error": f"Translation failed: {str(e)}"})
+        return
+
+    translation_cache[cache_key] = translation
+    if len(translation_cache) > TRANSLATION_CACHE_SIZE:
+        translation_cache.popitem(last=False)
+
+    logger.info(
+        "stream backend=%s in=%d out=%d ttft=%.3fs total=%.3fs",
+        backend, len(request.text), len(translation),
+        first_token_time or 0.0, time.time() - request_start
+    )
+
+    # Final event carries the full cleaned text so clients can replace the deltas
+    yield sse_event({"done": True, "text": translation})
+
+def immediate_response(text, stream):
+    # Answer without generating, as a one-event stream when one was requested
+    if stream:
+        return StreamingResponse(
+            iter([sse_event({"done": True, "text": text})]),
+            media_type="text/event-stream"
+        )
+    return {"text": text}
+
+@app.post("/translate")
+async def translate(request: TranslationRequest):
+    try:
+        if not request.text.strip():
+            raise HTTPException(
+                status_code=400,
+                detail="Empty text provided for translation"
+            )
+            
+        # Same language on both sides: nothing to translate
+        if request.source_lang == request.target_lang:
+            return immediate_response(request.text.strip(), request.stream)
+
+        request_start = time.time()
+        backend = request.backend or translation_backend
         
-        # Extract translation from response, removing TL tags
-        translation = response["choices"][0]["message"]["content"].strip()
-        if translation.startswith("<TL>"):
-            translation = translation[4:].strip()
-        if translation.endswith("</TL>"):
-            translation = translation[:-5].strip()
-        translation = translation.strip('"\'')
+        # Short chat phrases ("Hi", "Thanks") repeat a lot; serve them from the cache
+        cache_key = (request.text, request.source_lang, request.target_lang, backend)
+        cached = translation_cache.get(cache_key)
+        if cached is not None:
+            translation_cache.move_to_end(cache_key)
+            return immediate_response(cached, request.stream)
+
+        if backend not in loaded_backends:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Translation backend '{backend}' is not enabled on this server"
+            )
+
+        # First tokens go out after prefill instead of after the full decode
+        if request.stream:
+            return StreamingResponse(
+                stream_translation(request, backend, cache_key),
+                media_type="text/event-stream"
+            )
+
+        # Generation
+        generate_start = time.time()
+        if backend == 'nllb':
+            translation = await translate_nllb(request.text, request.source_lang, request.target_lang)
+        else:
+            translation = await translate_llm(request.text, request.source_lang, request.target_lang)
+        generate_time = time.time() - generate_start
+
+        translation_cache[cache_key] = translation
+        if len(translation_cache) > TRANSLATION_CACHE_SIZE:
+            translation_cache.popitem(last=False)
         
         total_time = time.time() - request_start
         
-        # Log performance metrics
-        logger.info(f"Translation completed in {total_time:.2f} seconds")
-        logger.info(f"Performance metrics:")
-        logger.info(f"- Input text length: {len(request.text)} chars")
-        logger.info(f"- Output text length: {len(translation)} chars")
-        logger.info(f"- Generation time: {generate_time:.3f}s")
+        # One summary line per request; lazy %-formatting, so nothing is
+        # formatted when INFO is filtered out
+        logger.info(
+            "translate backend=%s in=%d out=%d generate=%.3fs total=%.3fs",
+            backend, len(request.text), len(translation), generate_time, total_time
+        )
         
         return {"text": translation}
             
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in translation: {str(e)}", exc_info=True)
         raise HTTPException(
@@ -221,4 +637,15 @@ Examples of natural translations:
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8003) 
\ No newline at end of file
+    # uvloop event loop and httptools parser; a single worker because the
+    # embedded model lives in this process (concurrency comes from to_thread)
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=8003,
+        loop="uvloop",
+        http="httptools",
+        workers=1,
+        limit_concurrency=64,  # Enough in-flight requests to fill NLLB/remote batches; 503 beyond that
+        log_level="warning"
+    ) 
\ No newline at end of file
@@ -1,20 +1,21 @@
 from fastapi import FastAPI, HTTPException, UploadFile, File, Form
-from fastapi.responses import Response
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
+from typing import Optional
 import io
-import soundfile as sf
-import base64
+import hashlib
+import asyncio
+import threading
+import struct
 import os
-import tempfile
+# Must be set before torch initializes CUDA: growable segments instead of
+# fixed-size blocks keep fragmentation and reserved-but-unused VRAM low
+os.environ.setdefault("PYTORCH_CUDA_ALLOC_CONF", "expandable_segments:True")
 import torch
 import logging
-from TTS.api import TTS
 import numpy as np
+from collections import OrderedDict
 import time
-from TTS.tts.configs.xtts_config import XttsConfig
-from TTS.tts.models.xtts import Xtts
-import torchaudio
-from huggingface_hub import snapshot_download
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -29,22 +30,50 @@ class TTSRequest(BaseModel):
     text: str
     language: str = "en"
 
-# Initialize TTS model
-try:
+def pcm16_wav(audio, sr):
+    # Mono 16-bit PCM WAV: a fixed 44-byte RIFF header followed by the samples,
+    # no need to go through libsndfile for that
+    samples = np.clip(audio * 32767.0, -32768, 32767).astype(np.int16)
+    header = struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + samples.nbytes, b"WAVE",
+        b"fmt ", 16, 1, 1, sr, sr * 2, 2, 16,
+        b"data", samples.nbytes
+    )
+    return header + samples.tobytes()
+
+model = None
+model_ready = False  # Set once loading and warmup have finished
+load_error = None  # Set if loading or warmup raised
+# XTTS calls run in worker threads so the event loop stays responsive; the
+# lock keeps them sequential on the shared model
+model_lock = threading.Lock()
+device = "cuda" if torch.cuda.is_available() else "cpu"
+# fp16 autocast around inference (CUDA only). Off by default: not yet checked
+# against DeepSpeed's injected kernels or for audio quality
+use_autocast = device == "cuda" and os.getenv('TTS_AUTOCAST', '0') == '1'
+
+def initialize_model():
+    global model, model_ready
     start_time = time.time()
-    
-    # Clear cache
-    torch.cuda.empty_cache()
+
+    # Heavy imports happen here, off the startup path, so the port binds and
+    # /health answers while Coqui and the weights load
+    from TTS.tts.configs.xtts_config import XttsConfig
+    from TTS.tts.models.xtts import Xtts
+    from huggingface_hub import snapshot_download
 
     # Check for CUDA availability
-    device = "cuda" if torch.cuda.is_available() else "cpu"
     logger.info(f"Using device: {device}")
     
     if device.startswith("cuda"):
+        # Route every remaining fp32 matmul through TF32 tensor cores; the
+        # legacy flags are kept for cuDNN convolutions and older PyTorch
+        torch.set_float32_matmul_precision("high")
         torch.backends.cuda.matmul.allow_tf32 = True
         torch.backends.cudnn.allow_tf32 = True
-        torch.cuda.set_per_process_memory_fraction(0.4)
-        torch.cuda.empty_cache()
+        major, minor = torch.cuda.get_device_capability()
+        logger.info(f"CUDA compute capability: {major}.{minor} (TF32 needs 8.0+)")
     
     # Initialize with manual loading for DeepSpeed support
     model_name = "tts_models/multilingual/multi-dataset/xtts_v2"
@@ -67,23 +96,166 @@ try:
     model.load_checkpoint(
         config, 
         checkpoint_dir=model_path,
-        use_deepspeed=True
+        use_deepspeed=device == "cuda"  # DeepSpeed inference kernels are CUDA-only
     )
-    model.cuda()
+    if device == "cuda":
+        model.cuda()
+        logger.info(f"fp16 autocast: {'on' if use_autocast else 'off'}")
+
+    # Optionally compile the HiFi-GAN vocoder, which runs once per utterance on
+    # a variable-length latent sequence. The GPT decoder is left to DeepSpeed's
+    # inference kernels. Off by default: measure before enabling.
+    if os.getenv('TTS_COMPILE', '0') == '1':
+        logger.info("Compiling HiFi-GAN decoder with torch.compile")
+        model.hifigan_decoder = torch.compile(model.hifigan_decoder, dynamic=True)
+
+    # Warm up once so DeepSpeed kernel setup (and compilation, if enabled)
+    # happens before the first request; a synthetic tone stands in for a voice
+    logger.info("Warming up model...")
+    warmup_start = time.time()
+    warmup_sr = 22050
+    t = np.arange(3 * warmup_sr, dtype=np.float32) / warmup_sr
+    warmup_buffer = io.BytesIO(pcm16_wav(0.3 * np.sin(2 * np.pi * 220 * t), warmup_sr))
+    warmup_latent, warmup_embedding = model.get_conditioning_latents(audio_path=[warmup_buffer])
+    with torch.autocast(device_type="cuda", dtype=torch.float16, enabled=use_autocast):
+        model.inference(
+            text="Warmup",
+            language="en",
+            gpt_cond_latent=warmup_latent,
+            speaker_embedding=warmup_embedding,
+            enable_text_splitting=False
+        )
+    logger.info(f"Model warmup completed in {time.time() - warmup_start:.2f} seconds")
     
     init_time = time.time() - start_time
     logger.info(f"XTTS v2 Model initialized successfully in {init_time:.2f} seconds")
-    
-except Exception as e:
-    logger.error(f"Error initializing TTS model: {e}")
-    raise e
+    model_ready = True
+
+def on_model_loaded(task):
+    # Nothing awaits the loading task; record a failure for /health
+    global load_error
+    if task.cancelled() or task.exception() is None:
+        return
+    load_error = str(task.exception())
+    logger.error(f"Error initializing TTS model: {load_error}", exc_info=task.exception())
+
+@app.on_event("startup")
+async def start_model_loading():
+    # Load in the background: the server accepts connections immediately and
+    # reports readiness through /health
+    app.state.model_loading = asyncio.create_task(asyncio.to_thread(initialize_model))
+    app.state.model_loading.add_done_callback(on_model_loaded)
+
+@app.get("/health")
+async def health():
+    if load_error is not None:
+        return JSONResponse(status_code=500, content={"status": "error", "detail": load_error})
+    if not model_ready:
+        return JSONResponse(status_code=503, content={"status": "loading"})
+    return {"status": "ready"}
+
+def require_model():
+    if load_error is not None:
+        raise HTTPException(status_code=503, detail=f"TTS model failed to load: {load_error}")
+    if not model_ready:
+        raise HTTPException(status_code=503, detail="TTS model is still loading")
+
+# Conditioning latents per speaker clip, keyed by a hash of the uploaded audio.
+# Clients send the same reference clip with every request, so the speaker
+# encoder only has to run once per voice.
+SPEAKER_CACHE_SIZE = 256
+speaker_cache = OrderedDict()
+
+def encode_wav(audio):
+    # Ensure audio is a float32 array; asarray only copies when the dtype
+    # actually changes (XTTS already hands back float32)
+    audio = np.asarray(audio, dtype=np.float32)
+    # Peak from the min/max reductions, without materializing np.abs(audio);
+    # the buffer belongs to this request, so scale it in place
+    peak = max(audio.max(), -audio.min())
+    if peak > 1.0:
+        audio *= 1.0 / peak
+
+    # Use correct sample rate from XTTS docs
+    sr = 24000  # XTTS v2 uses 24kHz sample rate
+
+    # Log audio properties
+    logger.info(f"Audio properties:")
+    logger.info(f"- Sample rate: {sr}")
+    logger.info(f"- Shape: {audio.shape}")
+    logger.info(f"- Data type: {audio.dtype}")
+    logger.info(f"- Value range: [{audio.min():.3f}, {audio.max():.3f}]")
+
+    # Calculate duration in seconds
+    duration = len(audio) / sr
+
+    # Convert to bytes
+    audio_bytes = pcm16_wav(audio, sr)
+    return audio_bytes, sr, duration
+
+def compute_speaker_latents(content):
+    # torchaudio decodes the upload straight from memory, so the clip never
+    # touches the disk
+    with model_lock:
+        return model.get_conditioning_latents(audio_path=[io.BytesIO(content)])
+
+def synthesize(text, language, gpt_cond_latent, speaker_embedding):
+    with model_lock:
+        # With TTS_AUTOCAST=1 the matmuls run in fp16 on tensor cores; the
+        # weights stay fp32 either way
+        with torch.autocast(device_type="cuda", dtype=torch.float16, enabled=use_autocast):
+            return model.inference(
+                text=text,
+                language=language,
+                gpt_cond_latent=gpt_cond_latent,
+                speaker_embedding=speaker_embedding,
+                # Add new parameters for better quality
+                speed=1.0,  # Default speech speed
+                enable_text_splitting=True  # Better handling of long texts
+            )
+
+async def get_speaker_latents(content):
+    # Returns (speaker_id, latents); the id is the content hash, so uploading
+    # the same clip again maps to the same cache entry
+    speaker_id = hashlib.sha256(content).hexdigest()
+    latents = speaker_cache.get(speaker_id)
+    if latents is not None:
+        speaker_cache.move_to_end(speaker_id)
+        logger.info("Using cached speaker latents")
+    else:
+        logger.info("Computing speaker latents...")
+        latents = await asyncio.to_thread(compute_speaker_latents, content)
+        speaker_cache[speaker_id] = latents
+        if len(speaker_cache) > SPEAKER_CACHE_SIZE:
+            speaker_cache.popitem(last=False)
+    return speaker_id, latents
+
+@app.post("/speaker")
+async def register_speaker(speaker_audio: UploadFile = File(...)):
+    # Upload a reference clip once per session; later /tts calls pass the
+    # returned speaker_id instead of re-sending the audio
+    require_model()
+
+    try:
+        content = await speaker_audio.read()
+        speaker_id, _ = await get_speaker_latents(content)
+        return {"speaker_id": speaker_id}
+    except Exception as e:
+        logger.error(f"Error registering speaker: {str(e)}", exc_info=True)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Speaker registration failed: {str(e)}"
+        )
 
 @app.post("/tts")
 async def text_to_speech(
     text: str = Form(...),
     language: str = Form("en"),
-    speaker_audio: UploadFile = File(...)
+    speaker_audio: Optional[UploadFile] = File(None),
+    speaker_id: Optional[str] = Form(None)
 ):
+    require_model()
+
     try:
         request_start_time = time.time()
         logger.info("Text to speech request received")
@@ -98,99 +270,64 @@ async def text_to_speech(
         logger.info(f"language={language}")
 
         # Handle speaker audio
-        speaker_wav = None
-        try:
-            file_start_time = time.time()
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as temp_file:
-                content = await speaker_audio.read()
-                temp_file.write(content)
-                speaker_wav = temp_file.name
-            file_time = time.time() - file_start_time
-            logger.info(f"Saved speaker audio to {speaker_wav} in {file_time:.2f} seconds")
-
-            # Get conditioning latents
-            logger.info("Computing speaker latents...")
-            gpt_cond_latent, speaker_embedding = model.get_conditioning_latents(
-                audio_path=[speaker_wav]
+        file_start_time = time.time()
+        latents = speaker_cache.get(speaker_id) if speaker_id else None
+        if latents is not None:
+            speaker_cache.move_to_end(speaker_id)
+        elif speaker_audio is not None:
+            _, latents = await get_speaker_latents(await speaker_audio.read())
+        else:
+            # Evicted or never registered: the client re-uploads via /speaker
+            raise HTTPException(
+                status_code=404,
+                detail="Unknown speaker_id and no speaker_audio provided"
             )
+        gpt_cond_latent, speaker_embedding = latents
+        file_time = time.time() - file_start_time
 
-            # Generate speech with DeepSpeed
-            logger.info("Generating speech...")
-            generation_start_time = time.time()
-            out = model.inference(
-                text=cleaned_text,
-                language=language,
-                gpt_cond_latent=gpt_cond_latent,
-                speaker_embedding=speaker_embedding,
-                # Add new parameters for better quality
-                speed=1.0,  # Default speech speed
-                enable_text_splitting=True  # Better handling of long texts
-            )
-            generation_time = time.time() - generation_start_time
-            
-            # Extract wav from output dictionary
-            audio = out["wav"]  # Model returns dict with 'wav' key
-            
-            # Convert to numpy array if not already
-            processing_start_time = time.time()
-            if not isinstance(audio, np.ndarray):
-                audio = np.array(audio)
-
-            # Ensure audio is in float32 format and normalized
-            audio = audio.astype(np.float32)
-            if np.abs(audio).max() > 1.0:
-                audio = audio / np.abs(audio).max()
-
-            # Use correct sample rate from XTTS docs
-            sr = 24000  # XTTS v2 uses 24kHz sample rate
-
-            # Log audio properties
-            logger.info(f"Audio properties:")
-            logger.info(f"- Sample rate: {sr}")
-            logger.info(f"- Shape: {audio.shape}")
-            logger.info(f"- Data type: {audio.dtype}")
-            logger.info(f"- Value range: [{audio.min():.3f}, {audio.max():.3f}]")
-
-            # Calculate duration in seconds
-            duration = len(audio) / sr
-
-            # Convert to bytes
-            buffer = io.BytesIO()
-            sf.write(buffer, audio, sr, format='WAV', subtype='PCM_16')
-            audio_bytes = buffer.getvalue()
-            processing_time = time.time() - processing_start_time
-            logger.info(f"Audio processing completed in {processing_time:.2f} seconds")
-            logger.info(f"WAV file size: {len(audio_bytes)} bytes")
-
-            total_time = time.time() - request_start_time
-            logger.info(f"Total request processing time: {total_time:.2f} seconds")
-            logger.info(f"Latency breakdown:")
-            logger.info(f"- File handling: {file_time:.2f}s")
-            logger.info(f"- Speech generation: {generation_time:.2f}s")
-            logger.info(f"- Audio processing: {processing_time:.2f}s")
-
-            # Convert to base64
-            audio_base64 = base64.b64encode(audio_bytes).decode('utf-8')
-
-            # Return JSON response with audio, duration and all the timing info
-            return {
-                "audio": audio_base64,
-                "duration": duration,
-                "sample_rate": sr,
-                "timings": {
-                    "file_handling": file_time,
-                    "generation": generation_time,
-                    "processing": processing_time,
-                    "total": total_time
-                }
-            }
+        # Generate speech with DeepSpeed
+        logger.info("Generating speech...")
+        generation_start_time = time.time()
+        out = await asyncio.to_thread(
+            synthesize, cleaned_text, language, gpt_cond_latent, speaker_embedding
+        )
+        generation_time = time.time() - generation_start_time
+        
+        # Extract wav from output dictionary
+        audio = out["wav"]  # Model returns dict with 'wav' key
+        
+        # Normalization and WAV encoding are CPU-bound; run them in a worker
+        # thread so the event loop keeps serving other requests
+        processing_start_time = time.time()
+        audio_bytes, sr, duration = await asyncio.to_thread(encode_wav, audio)
+        processing_time = time.time() - processing_start_time
+        logger.info(f"Audio processing completed in {processing_time:.2f} seconds")
+        logger.info(f"WAV file size: {len(audio_bytes)} bytes")
 
-        finally:
-            # Clean up temporary file if it exists
-            if speaker_wav and os.path.exists(speaker_wav):
-                os.unlink(speaker_wav)
-                logger.info(f"Cleaned up temporary file {speaker_wav}")
+        total_time = time.time() - request_start_time
+        logger.info(f"Total request processing time: {total_time:.2f} seconds")
+        logger.info(f"Latency breakdown:")
+        logger.info(f"- File handling: {file_time:.2f}s")
+        logger.info(f"- Speech generation: {generation_time:.2f}s")
+        logger.info(f"- Audio processing: {processing_time:.2f}s")
+
+        # Return the raw WAV; duration and timing info travel in headers, so
+        # the audio is not base64-inflated by a third and no encode pass runs
+        return Response(
+            content=audio_bytes,
+            media_type="audio/wav",
+            headers={
+                "X-Duration": str(duration),
+                "X-Sample-Rate": str(sr),
+                "X-File-Handling-Time": f"{file_time:.3f}",
+                "X-Generation-Time": f"{generation_time:.3f}",
+                "X-Processing-Time": f"{processing_time:.3f}",
+                "X-Total-Time": f"{total_time:.3f}"
+            }
+        )
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in TTS generation: {str(e)}", exc_info=True)
         raise HTTPException(
@@ -200,4 +337,13 @@ async def text_to_speech(
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+    # XTTS is loaded once onto the single GPU, so extra workers would only
+    # compete for it with their own copies
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=8001,
+        loop="uvloop",
+        http="httptools",
+        workers=1
+    )
\ No newline at end of file
@@ -1,11 +1,19 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
+import os
+# Allocator settings are read when torch is imported
+os.environ.setdefault("PYTORCH_CUDA_ALLOC_CONF", "expandable_segments:True")
 import torch
-from transformers import AutoModelForSpeechSeq2Seq, AutoProcessor, pipeline
 import logging
+import asyncio
 import io
-import base64
-import os
+import orjson
+import hashlib
+from collections import OrderedDict
+import pybase64
+import soundfile as sf
+import numpy as np
 from dotenv import load_dotenv
 import time  # Add time import
 
@@ -16,7 +24,8 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+# orjson serializes responses in C instead of through stdlib json
+app = FastAPI(default_response_class=ORJSONResponse)
 
 class TranscriptionRequest(BaseModel):
     audio_data: str  # Base64 encoded audio
@@ -24,34 +33,104 @@ class TranscriptionRequest(BaseModel):
 
 # Global variable for the pipeline
 local_pipe = None
+english_model = None  # Optional faster-whisper model used for English requests
+model_ready = False  # Set once loading and warmup have finished
+load_error = None  # Set if loading or warmup raised
+
+# "faster_whisper" (CTranslate2 kernels, same large-v3 weights) or
+# "transformers" (HF pipeline)
+whisper_backend = os.getenv('WHISPER_BACKEND', 'faster_whisper')
+
+# Chunking for the transformers pipeline. 30s is Whisper's native window;
+# lower the batch size only when VRAM is tight
+chunk_length_s = int(os.getenv('WHISPER_CHUNK_S', '30'))
+pipeline_batch_size = int(os.getenv('WHISPER_BATCH', '16'))
+stride_length_s = int(os.getenv('WHISPER_STRIDE', '5'))
+
+# English requests go to distil-large-v3 on the faster-whisper backend: 2
+# decoder layers instead of 32 at close to large-v3 accuracy on English.
+# Set WHISPER_ENGLISH_MODEL= (empty) to use large-v3 for every language.
+english_model_name = os.getenv('WHISPER_ENGLISH_MODEL', 'distil-large-v3')
+
+# Transformers backend: requests arriving within WHISPER_BATCH_WINDOW share
+# one pipeline call, which fills the pipeline's batch_size
+WHISPER_BATCH_WINDOW = 0.01
+WHISPER_MAX_BATCH_SIZE = 16
+transcribe_queue = asyncio.Queue()
+
+# faster-whisper runs each transcription in its own thread; this bounds how
+# many decode on the GPU at once (each holds its own activations and cache)
+max_concurrent = int(os.getenv('WHISPER_MAX_CONCURRENT', '4'))
+inference_semaphore = asyncio.Semaphore(max_concurrent)
+
+# Transcripts of recently seen audio (client retries, repeated clips), keyed
+# by a hash of the audio bytes and the language
+TRANSCRIPT_CACHE_SIZE = 1024
+transcript_cache = OrderedDict()
 
 def initialize_model():
-    global local_pipe
+    global local_pipe, english_model
     if local_pipe is not None:
         return local_pipe
         
     start_time = time.time()
     logger.info("Initializing local Whisper model")
     try:
-        # Clear cache and set memory optimizations
+        # Backend libraries are imported here, inside the loading thread
+        if whisper_backend == 'faster_whisper':
+            from faster_whisper import WhisperModel
+        else:
+            from transformers import AutoModelForSpeechSeq2Seq, AutoProcessor, pipeline
+
         cuda_start = time.time()
-        torch.cuda.empty_cache()
-        
+
         # Enable TF32 for better performance on Ampere GPUs (like A100)
         if torch.cuda.is_available():
+            torch.set_float32_matmul_precision("high")
             torch.backends.cuda.matmul.allow_tf32 = True
             torch.backends.cudnn.allow_tf32 = True
-            # Set memory efficient options - using 30% of VRAM since Whisper is smaller than XTTS
-            torch.cuda.set_per_process_memory_fraction(0.3)
+            major, minor = torch.cuda.get_device_capability()
+            logger.info(f"CUDA compute capability: {major}.{minor} (TF32 needs 8.0+)")
+            # The encoder's conv front-end always sees the same 30s mel shape,
+            # so let cuDNN autotune it once (during warmup)
+            torch.backends.cudnn.benchmark = True
 
         device = "cuda" if torch.cuda.is_available() else "cpu"
         torch_dtype = torch.float16 if torch.cuda.is_available() else torch.float32
         
         logger.info(f"Using device: {device}")
         cuda_time = time.time() - cuda_start
+
+        if whisper_backend == 'faster_whisper':
+            model_start = time.time()
+            # int8 weights with fp16 activations on GPU: half the weight memory
+            # and bandwidth of float16 with int8 GEMMs in the decoder
+            model_kwargs = {
+                "device": device,
+                "compute_type": "int8_float16" if device == "cuda" else "int8",
+                "num_workers": max_concurrent  # Parallel transcribe() calls from threads
+            }
+            if english_model_name:
+                english_model = WhisperModel(english_model_name, **model_kwargs)
+                logger.info(f"English model: {english_model_name}")
+            local_pipe = WhisperModel("large-v3", **model_kwargs)
+            model_time = time.time() - model_start
+            logger.info(f"faster-whisper model loaded in {model_time:.2f} seconds")
+            return local_pipe
         
         model_id = "openai/whisper-large-v3"
         
+        # FlashAttention-2 when installed (fp16 on CUDA only), otherwise the
+        # fused SDPA kernels built into torch
+        attn_impl = "sdpa"
+        if device == "cuda":
+            try:
+                import flash_attn  # noqa: F401
+                attn_impl = "flash_attention_2"
+            except ImportError:
+                pass
+        logger.info(f"Attention implementation: {attn_impl}")
+
         # Load model
         model_start = time.time()
         model = AutoModelForSpeechSeq2Seq.from_pretrained(
@@ -59,10 +138,35 @@ def initialize_model():
             torch_dtype=torch_dtype,
             low_cpu_mem_usage=True,
             use_safetensors=True,
+            attn_implementation=attn_impl,
             device_map="auto"
         )
         model_time = time.time() - model_start
         logger.info(f"Model loaded in {model_time:.2f} seconds")
+
+        # Optional int8 weights for the encoder/decoder linears: Quanto on GPU
+        # (activations stay fp16), dynamic quantization on CPU
+        if os.getenv('WHISPER_QUANTIZE', '0') == '1':
+            if device == "cuda":
+                from optimum.quanto import quantize, freeze, qint8
+                quantize(model, weights=qint8)
+                freeze(model)
+            else:
+                model = torch.ao.quantization.quantize_dynamic(
+                    model, {torch.nn.Linear}, dtype=torch.qint8
+                )
+            logger.info("Whisper weights quantized to int8")
+
+        # Optionally capture the decoder step as a CUDA graph: a static KV
+        # cache keeps shapes fixed so the graph is reused across tokens and
+        # requests. The first transcription pays the compilation cost.
+        if device == "cuda" and os.getenv('WHISPER_COMPILE', '0') == '1':
+            logger.info("Compiling model forward with torch.compile (reduce-overhead)")
+            model.generation_config.cache_implementation = "static"
+            # Each distinct decoder shape is a separate graph; the default
+            # limit of 8 recompiles is exhausted by batch/position variants
+            torch._dynamo.config.cache_size_limit = 64
+            model.forward = torch.compile(model.forward, mode="reduce-overhead", fullgraph=True)
         
         # Load processor
         processor_start = time.time()
@@ -78,9 +182,9 @@ def initialize_model():
             tokenizer=processor.tokenizer,
             feature_extractor=processor.feature_extractor,
             torch_dtype=torch_dtype,
-            chunk_length_s=10,
-            batch_size=16,
-            stride_length_s=3,
+            chunk_length_s=chunk_length_s,
+            batch_size=pipeline_batch_size,
+            stride_length_s=stride_length_s,
             return_timestamps=True
         )
         pipeline_time = time.time() - pipeline_start
@@ -98,50 +202,222 @@ def initialize_model():
         logger.error(f"Error initializing local Whisper model: {e}")
         raise e
 
+def decode_audio(audio_bytes):
+    # soundfile reads WAV/FLAC/OGG in-process (the pipeline resamples to
+    # 16 kHz); anything else falls back to ffmpeg
+    try:
+        audio, sampling_rate = sf.read(io.BytesIO(audio_bytes), dtype="float32")
+    except sf.LibsndfileError:
+        from transformers.pipelines.audio_utils import ffmpeg_read
+        return {"raw": ffmpeg_read(audio_bytes, 16000), "sampling_rate": 16000}
+    if audio.ndim > 1:
+        audio = audio.mean(axis=1)
+    return {"raw": audio, "sampling_rate": sampling_rate}
+
+def run_pipeline(audios, language):
+    # The pipeline only uses no_grad; inference_mode also skips version
+    # counter and view tracking on every op of the decode loop
+    with torch.inference_mode():
+        return local_pipe(
+            audios,
+            generate_kwargs={
+                "language": language,
+                "task": "transcribe",
+                "max_length": 448
+            }
+        )
+
+def transcribe_group(audios, language):
+    # Runs in the batch worker's thread. Returns a result or an exception per
+    # clip, so one bad upload only fails its own request
+    outcomes = [None] * len(audios)
+    decoded = []
+    for i, audio_bytes in enumerate(audios):
+        try:
+            decoded.append((i, decode_audio(audio_bytes)))
+        except Exception as e:
+            outcomes[i] = e
+    if not decoded:
+        return outcomes
+
+    try:
+        results = run_pipeline([audio for _, audio in decoded], language)
+        for (i, _), result in zip(decoded, results):
+            outcomes[i] = result
+    except Exception as e:
+        # Find the offending clip(s) by retrying one at a time
+        logger.warning(f"Batched transcription failed, retrying clips individually: {e}")
+        for i, audio in decoded:
+            try:
+                outcomes[i] = run_pipeline([audio], language)[0]
+            except Exception as clip_error:
+                outcomes[i] = clip_error
+    return outcomes
+
+async def transcribe_batch_worker():
+    while True:
+        batch = [await transcribe_queue.get()]
+        await asyncio.sleep(WHISPER_BATCH_WINDOW)
+        while len(batch) < WHISPER_MAX_BATCH_SIZE and not transcribe_queue.empty():
+            batch.append(transcribe_queue.get_nowait())
+
+        # generate_kwargs apply to the whole call, so batch per language
+        by_language = {}
+        for audio, language, future in batch:
+            by_language.setdefault(language, []).append((audio, future))
+
+        for language, items in by_language.items():
+            outcomes = await asyncio.to_thread(
+                transcribe_group, [audio for audio, _ in items], language
+            )
+            for (_, future), outcome in zip(items, outcomes):
+                if future.done():
+                    continue
+                if isinstance(outcome, Exception):
+                    future.set_exception(outcome)
+                else:
+                    future.set_result(outcome)
+
+def warmup_model():
+    # Run a few seconds of low tone through the model so CUDA kernel selection,
+    # cuDNN autotuning and torch.compile (if enabled) happen before the first request
+    logger.info("Warming up model...")
+    warmup_start = time.time()
+    t = np.arange(5 * 16000, dtype=np.float32) / 16000
+    warmup_audio = 0.1 * np.sin(2 * np.pi * 220 * t).astype(np.float32)
+    if whisper_backend == 'faster_whisper':
+        for model in filter(None, (local_pipe, english_model)):
+            segments, _ = model.transcribe(warmup_audio, language="en", beam_size=1)
+            list(segments)
+    else:
+        run_pipeline([{"raw": warmup_audio, "sampling_rate": 16000}], "en")
+    logger.info(f"Model warmup completed in {time.time() - warmup_start:.2f} seconds")
+
+def load_model():
+    global model_ready
+    initialize_model()
+    warmup_model()
+    model_ready = True
+
+def on_model_loaded(task):
+    # Without this a failed load would leave /health at "loading"
+    global load_error
+    if task.cancelled() or task.exception() is None:
+        return
+    load_error = str(task.exception())
+    logger.error(f"Error initializing Whisper model: {load_error}", exc_info=task.exception())
+
+@app.on_event("startup")
+async def start_model_loading():
+    app.state.model_loading = asyncio.create_task(asyncio.to_thread(load_model))
+    app.state.model_loading.add_done_callback(on_model_loaded)
+    if whisper_backend != 'faster_whisper':
+        app.state.batch_worker = asyncio.create_task(transcribe_batch_worker())
+
+@app.get("/health")
+async def health():
+    if load_error is not None:
+        return JSONResponse(status_code=500, content={"status": "error", "detail": load_error})
+    if not model_ready:
+        return JSONResponse(status_code=503, content={"status": "loading"})
+    return {"status": "ready"}
+
+def require_model():
+    if load_error is not None:
+        raise HTTPException(status_code=503, detail=f"Whisper model failed to load: {load_error}")
+    if not model_ready:
+        raise HTTPException(status_code=503, detail="Whisper model is still loading")
+
+def faster_whisper_model(language):
+    if language == "en" and english_model is not None:
+        return english_model
+    return local_pipe
+
+def transcribe_faster_whisper(audio_bytes, language):
+    segments, _ = faster_whisper_model(language).transcribe(
+        io.BytesIO(audio_bytes),
+        language=language,
+        task="transcribe",
+        beam_size=1,
+        vad_filter=True
+    )
+    # Segments are decoded lazily while iterating
+    return "".join(segment.text for segment in segments)
+
+async def run_transcription(audio_bytes, language):
+    cache_key = (hashlib.blake2b(audio_bytes, digest_size=16).digest(), language)
+    text = transcript_cache.get(cache_key)
+    if text is not None:
+        transcript_cache.move_to_end(cache_key)
+        logger.info("Using cached transcription")
+        return text
+
+    inference_start = time.time()
+    if whisper_backend == 'faster_whisper':
+        # Threads run in parallel here: faster-whisper decodes without the GIL
+        async with inference_semaphore:
+            text = await asyncio.to_thread(transcribe_faster_whisper, audio_bytes, language)
+    else:
+        future = asyncio.get_running_loop().create_future()
+        await transcribe_queue.put((audio_bytes, language, future))
+        text = (await future)["text"]
+    inference_time = time.time() - inference_start
+
+    logger.info(f"Inference: {inference_time:.2f}s")
+    logger.info(f"Input audio size: {len(audio_bytes)} bytes")
+    logger.info(f"Output text length: {len(text)} chars")
+    if inference_time > 0:  # Avoid division by zero
+        logger.info(f"Processing speed: {len(audio_bytes) / inference_time / 1024:.1f} KB/s")
+
+    transcript_cache[cache_key] = text
+    if len(transcript_cache) > TRANSCRIPT_CACHE_SIZE:
+        transcript_cache.popitem(last=False)
+    return text
+
 @app.post("/transcribe")
 async def transcribe(request: TranscriptionRequest):
-    global local_pipe
-    
+    require_model()
+
     try:
         request_start = time.time()
         
-        # Initialize model if not already initialized
-        if local_pipe is None:
-            init_start = time.time()
-            local_pipe = initialize_model()
-            init_time = time.time() - init_start
-            logger.info(f"Model initialization took {init_time:.2f} seconds")
-            
         # Decode base64 audio data
         decode_start = time.time()
-        audio_bytes = base64.b64decode(request.audio_data)
+        # SIMD base64 decoder; the payload is megabytes for longer clips
+        audio_bytes = pybase64.b64decode(request.audio_data, validate=False)
         decode_time = time.time() - decode_start
+        logger.info(f"Audio decoding: {decode_time:.2f}s")
         
-        # Process audio with local Whisper model
-        inference_start = time.time()
-        result = local_pipe(
-            audio_bytes,
-            generate_kwargs={
-                "language": request.language,
-                "task": "transcribe",
-                "max_length": 448
-            }
-        )
-        inference_time = time.time() - inference_start
+        text = await run_transcription(audio_bytes, request.language)
         
         total_time = time.time() - request_start
+        logger.info(f"Transcription completed in {total_time:.2f} seconds")
         
-        # Log timing information
+        return {"text": text}
+            
+    except Exception as e:
+        logger.error(f"Error in transcription: {str(e)}", exc_info=True)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Transcription failed: {str(e)}"
+        )
+
+# Binary variant of /transcribe: the request body is the audio file itself,
+# which skips base64 (a third larger on the wire) and JSON parsing
+@app.post("/transcribe_raw")
+async def transcribe_raw(request: Request, language: str = "en"):
+    require_model()
+
+    try:
+        request_start = time.time()
+        audio_bytes = await request.body()
+        
+        text = await run_transcription(audio_bytes, language)
+        
+        total_time = time.time() - request_start
         logger.info(f"Transcription completed in {total_time:.2f} seconds")
-        logger.info(f"Latency breakdown:")
-        logger.info(f"- Audio decoding: {decode_time:.2f}s")
-        logger.info(f"- Inference: {inference_time:.2f}s")
-        logger.info(f"Input audio size: {len(request.audio_data)} bytes")
-        logger.info(f"Output text length: {len(result['text'])} chars")
-        if inference_time > 0:  # Avoid division by zero
-            logger.info(f"Processing speed: {len(request.audio_data) / inference_time / 1024:.1f} KB/s")
         
-        return {"text": result["text"]}
+        return {"text": text}
             
     except Exception as e:
         logger.error(f"Error in transcription: {str(e)}", exc_info=True)
@@ -150,6 +426,54 @@ async def transcribe(request: TranscriptionRequest):
             detail=f"Transcription failed: {str(e)}"
         )
 
+def ndjson_line(payload):
+    return orjson.dumps(payload) + b"\n"
+
+async def stream_transcription(audio_bytes, language):
+    request_start = time.time()
+    try:
+        if whisper_backend == 'faster_whisper':
+            async with inference_semaphore:
+                segments, _ = await asyncio.to_thread(
+                    faster_whisper_model(language).transcribe,
+                    io.BytesIO(audio_bytes),
+                    language=language,
+                    task="transcribe",
+                    beam_size=1,
+                    vad_filter=True
+                )
+                # Each next() decodes one more window; send segments as they finish
+                segments = iter(segments)
+                while (segment := await asyncio.to_thread(next, segments, None)) is not None:
+                    yield ndjson_line({"text": segment.text, "start": segment.start, "end": segment.end})
+        else:
+            # The pipeline returns the whole transcript at once
+            yield ndjson_line({"text": await run_transcription(audio_bytes, language)})
+        logger.info(f"Streamed transcription completed in {time.time() - request_start:.2f} seconds")
+    except Exception as e:
+        logger.error(f"Error in streaming transcription: {str(e)}", exc_info=True)
+        yield ndjson_line({"error": f"Transcription failed: {str(e)}"})
+
+# Streaming variant of /transcribe_raw: one JSON object per line, sent per
+# segment while later audio is still being decoded
+@app.post("/transcribe_stream")
+async def transcribe_stream(request: Request, language: str = "en"):
+    require_model()
+
+    audio_bytes = await request.body()
+    return StreamingResponse(
+        stream_transcription(audio_bytes, language),
+        media_type="application/x-ndjson"
+    )
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8002) 
\ No newline at end of file
+    # One worker: a second process would load its own copy of the model
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=8002,
+        loop="uvloop",
+        http="httptools",
+        workers=1
+    ) 
\ No newline at end of file
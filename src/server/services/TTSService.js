@@ -1,10 +1,65 @@
 import fetch from 'node-fetch';
 import FormData from 'form-data';
+import { createHash } from 'crypto';
+
+// Speaker ids returned by /speaker, keyed by a hash of the reference clip
+const SPEAKER_ID_CACHE_SIZE = 256;
 
 class TTSService {
     constructor() {
         this.initialized = true;
         this.pythonServiceUrl = 'http://127.0.0.1:8001/tts';  // Python service URL
+        this.speakerServiceUrl = 'http://127.0.0.1:8001/speaker';
+        this.speakerIds = new Map();
+    }
+
+    /**
+     * Uploads a reference clip once and returns its speaker id
+     * @param {string} speakerAudioBase64 - Base64 encoded reference WAV
+     * @returns {Promise<string>} Speaker id to pass to /tts
+     */
+    async getSpeakerId(speakerAudioBase64) {
+        const key = createHash('sha1').update(speakerAudioBase64).digest('hex');
+        const cached = this.speakerIds.get(key);
+        if (cached) return cached;
+
+        const formData = new FormData();
+        formData.append('speaker_audio', Buffer.from(speakerAudioBase64, 'base64'), {
+            filename: 'reference.wav',
+            contentType: 'audio/wav'
+        });
+        const response = await fetch(this.speakerServiceUrl, {
+            method: 'POST',
+            body: formData
+        });
+        if (!response.ok) {
+            throw new Error(`TTS speaker registration error: ${response.statusText}`);
+        }
+
+        const { speaker_id: speakerId } = await response.json();
+        this.speakerIds.set(key, speakerId);
+        if (this.speakerIds.size > SPEAKER_ID_CACHE_SIZE) {
+            // Maps iterate in insertion order, so this drops the oldest entry
+            this.speakerIds.delete(this.speakerIds.keys().next().value);
+        }
+        console.log('Registered speaker audio for voice cloning');
+        return speakerId;
+    }
+
+    forgetSpeaker(speakerAudioBase64) {
+        this.speakerIds.delete(createHash('sha1').update(speakerAudioBase64).digest('hex'));
+    }
+
+    async requestSpeech(text, language, speakerId) {
+        const formData = new FormData();
+        formData.append('text', text);
+        formData.append('language', language);
+        formData.append('speaker_id', speakerId);
+
+        return fetch(this.pythonServiceUrl, {
+            method: 'POST',
+            body: formData
+        });
     }
 
     async synthesizeSpeech(text, language = 'en', speakerAudioBase64) {
@@ -13,35 +68,30 @@ class TTSService {
                 throw new Error('Speaker audio is required for voice cloning');
             }
 
-            // Create form data
-            const formData = new FormData();
-            formData.append('text', text);
-            formData.append('language', language);
-
-            // Convert base64 to buffer for speaker audio
-            const speakerBuffer = Buffer.from(speakerAudioBase64, 'base64');
-            formData.append('speaker_audio', speakerBuffer, {
-                filename: 'reference.wav',
-                contentType: 'audio/wav'
-            });
-            console.log('Using speaker audio for voice cloning');
+            let response = await this.requestSpeech(
+                text, language, await this.getSpeakerId(speakerAudioBase64)
+            );
 
-            const response = await fetch(this.pythonServiceUrl, {
-                method: 'POST',
-                body: formData
-            });
+            // The server evicted the speaker (or restarted): register it again
+            if (response.status === 404) {
+                this.forgetSpeaker(speakerAudioBase64);
+                response = await this.requestSpeech(
+                    text, language, await this.getSpeakerId(speakerAudioBase64)
+                );
+            }
 
             if (!response.ok) {
                 throw new Error(`TTS service error: ${response.statusText}`);
             }
 
-            // Parse JSON response that includes both audio and duration
-            const result = await response.json();
-            console.log("Audio duration:", result.duration);
+            // Body is the raw WAV file, duration comes in a header
+            const audioBuffer = Buffer.from(await response.arrayBuffer());
+            const duration = parseFloat(response.headers.get('x-duration'));
+            console.log("Audio duration:", duration);
             
             return {
-                audio: result.audio,  // Base64 audio
-                duration: result.duration  // Duration in seconds
+                audio: audioBuffer.toString('base64'),  // Base64 audio
+                duration: duration  // Duration in seconds
             };
         } catch (error) {
             console.error('TTS Error:', error);
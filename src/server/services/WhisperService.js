@@ -58,15 +58,14 @@ export class WhisperService {
             }
 
             // Use local Python Whisper server (as fallback or primary if no OpenAI key)
-            const response = await fetch('http://127.0.0.1:8002/transcribe', {
+            // Send the audio as the raw request body rather than base64 in JSON
+            const params = new URLSearchParams({ language });
+            const response = await fetch(`http://127.0.0.1:8002/transcribe_raw?${params}`, {
                 method: 'POST',
                 headers: {
-                    'Content-Type': 'application/json',
+                    'Content-Type': 'audio/wav',
                 },
-                body: JSON.stringify({
-                    audio_data: audioData.toString('base64'),
-                    language
-                })
+                body: audioData
             });
 
             if (!response.ok) {